@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+# Author: Hoan Bui Dang
+# Python: 2.7, 3.6
+
+"""
+Content-addressed archive of raw downloaded data (stock prices, FX rates).
+
+    save(content, source, symbol, start, end, folder, parse=None):
+        Save raw content (bytes) compressed under its hash and add it to the
+        index. Return the hash.
+
+    entries(folder, source='', symbol=''):
+        Return index entries as a dataframe, oldest first.
+
+    load(hash, folder):
+        Return raw content (bytes) of an archived download.
+
+Each download is stored once as folder/<2 first chars of hash>/<hash>.gz,
+identical downloads are not stored again. The index folder/index.csv keeps
+one line per download with columns Source, Symbol, Start, End, Hash.
+Older downloads of the same source and symbol are removed from the index
+(and from disk if no longer referenced) when a new download contains all
+their data, so the archive does not grow by re-downloading full history.
+Older downloads with data missing from the new one (gaps, revised values)
+are kept. By default data are compared line by line. If parse is given (a
+function returning a dataframe from raw content), only the parsed rows are
+compared: use it to ignore columns that are not used and change across
+downloads (e.g. adjusted prices, recalculated by Yahoo after each dividend
+or split).
+"""
+
+import pandas as pd
+import os
+import gzip
+import hashlib
+
+index_file = 'index.csv'
+index_cols = ['Source','Symbol','Start','End','Hash']
+
+def path(hash, folder): return folder + '/' + hash[:2] + '/' + hash + '.gz'
+
+def entries(folder, source='', symbol=''):
+    """ Return index entries (all if source and symbol are not specified). """
+
+    if not os.path.exists(folder + '/' + index_file):
+        return pd.DataFrame(columns=index_cols)
+    index = pd.read_csv(folder + '/' + index_file, dtype=str).fillna('')
+    if source != '': index = index[index['Source'] == source]
+    if symbol != '': index = index[index['Symbol'] == symbol]
+    return index
+
+def contains(new, old, parse=None):
+    """ return True if every line (or parsed row) of old is in new content """
+    if parse is None: return set(old.splitlines()) <= set(new.splitlines())
+    rows = lambda c: set(map(tuple, parse(c).values.tolist()))
+    return rows(old) <= rows(new)
+
+def save(content, source, symbol, start, end, folder, parse=None):
+    """ Archive raw content downloaded for symbol from source, return hash. """
+
+    hash = hashlib.sha1(content).hexdigest()
+    filename = path(hash, folder)
+    if not os.path.exists(filename):
+        if not os.path.exists(os.path.dirname(filename)):
+            os.makedirs(os.path.dirname(filename))
+        f = gzip.open(filename, 'wb')
+        f.write(content)
+        f.close()
+
+    index = entries(folder)
+    (start, end) = (str(start), str(end))
+    same = (index['Source'] == source) & (index['Symbol'] == symbol)
+    covered = same & (index['Start'] >= start) & (index['End'] <= end)
+    if any(same & (index['Hash'] == hash) & ~covered):
+        return hash # same content already archived with a wider range
+    # only drop older downloads whose data are all in the new content
+    if any(covered):
+        covered[covered] = [h == hash or
+                            contains(content, load(h, folder), parse)
+                            for h in index.loc[covered, 'Hash']]
+    removed = set(index.loc[covered, 'Hash'])
+    new = pd.DataFrame([[source, symbol, start, end, hash]], columns=index_cols)
+    index = pd.concat([index[~covered], new], ignore_index=True)
+    index.to_csv(folder + '/' + index_file, index=False)
+
+    # delete files of removed entries unless they are still referenced
+    for h in removed - set(index['Hash']):
+        os.remove(path(h, folder))
+    return hash
+
+def load(hash, folder):
+    """ Return raw content (bytes) archived under hash. """
+
+    f = gzip.open(path(hash, folder), 'rb')
+    content = f.read()
+    f.close()
+    return content
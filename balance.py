@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+# Author: Hoan Bui Dang
+# Python: 2.7
+
+"""
+Fast as-of balance queries on merged data (output of merge.py).
+
+    Balances(data, col='BalanceEOD_CAD'):
+        Index balances of all accounts in data (columns Date, Account, col).
+
+    Balances.balance_at(dates, accounts=None):
+        Return balances of accounts (all if not specified) on each of dates
+        as an account x date dataframe, and total balances on each date.
+
+The balance of an account on a date is its balance on the nearest date on
+or before that date, within the account's first and last dates (same as
+merge_asof on merged data, as done in plotbalance.ipynb). It is NaN for
+dates out of that range, and 0 if the balance itself is missing.
+"""
+
+import numpy as np
+import pandas as pd
+
+def todays(dates):
+    """ convert dates to integer number of days since 1970-01-01 """
+    return pd.DatetimeIndex(dates).values.astype('datetime64[D]').astype(np.int64)
+
+class Balances(object):
+
+    def __init__(self, data, col='BalanceEOD_CAD'):
+        """
+        Keep dates and balances of all accounts in one array sorted by
+        account then date (last row of each date only), with integer keys
+        (account number * number of days + day) for np.searchsorted.
+        """
+
+        names = data['Account'].astype(str).values
+        self.accounts = sorted(np.unique(names).tolist(), key=lambda s: s.lower())
+        self.names = np.unique(names) # sorted, position = account number
+        codes = np.searchsorted(self.names, names)
+        days = todays(data['Date'])
+        order = np.lexsort((days, codes))
+        (codes, days) = (codes[order], days[order])
+        last = np.r_[(codes[1:] != codes[:-1]) | (days[1:] != days[:-1]), True]
+
+        self.day_min = days.min()
+        self.ndays = days.max() - self.day_min + 1
+        self.key = (codes*self.ndays + days - self.day_min)[last]
+        self.values = data[col].values.astype(float)[order][last]
+        g = pd.Series(pd.DatetimeIndex(data['Date'])).groupby(names)
+        self.first = pd.DatetimeIndex(g.min()[self.names]).values # bounds
+        self.last = pd.DatetimeIndex(g.max()[self.names]).values
+
+    def balance_at(self, dates, accounts=None):
+        """
+        Return (balances, totals): balances is a dataframe indexed by
+        accounts with one column per date, totals is a series indexed by
+        dates (NaN if no account has data on the date).
+        """
+
+        dates = pd.DatetimeIndex(dates)
+        accounts = self.accounts if accounts is None else \
+                   [accounts] if isinstance(accounts, str) else list(accounts)
+        codes = np.searchsorted(self.names, accounts)
+        unknown = [a for (a, c) in zip(accounts, codes)
+                   if c == len(self.names) or self.names[c] != a]
+        if len(unknown) > 0: raise KeyError('Unknown accounts: %s' % unknown)
+
+        codes = codes[:, np.newaxis] # accounts x dates
+        key = codes*self.ndays + (todays(dates) - self.day_min)[np.newaxis, :]
+        pos = np.searchsorted(self.key, key.ravel(), 'right').reshape(key.shape) - 1
+        values = self.values[np.maximum(pos, 0)]
+        values[np.isnan(values)] = 0
+        inrange = (dates.values >= self.first[codes]) & \
+                  (dates.values <= self.last[codes])
+        values = np.where(inrange, values, np.nan)
+
+        balances = pd.DataFrame(values, index=pd.Index(accounts, name='Account'),
+                                columns=pd.Index(dates, name='Date'))
+        totals = balances.sum().where(balances.notnull().any())
+        return (balances, totals)
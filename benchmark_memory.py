@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+# Author: Hoan Bui Dang
+# Python: 2.7
+
+"""
+Measure memory of merged data with plain (object) columns, as merge.py
+used to build it, and with compact column types (see merged.py), on a
+synthetic history. Also check that both give identical csv output.
+
+Usage: python benchmark_memory.py [number of accounts] [rows per account]
+"""
+
+import numpy as np
+import pandas as pd
+import sys
+import os
+import tempfile
+import merged
+
+n_accounts = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+n_rows = int(sys.argv[2]) if len(sys.argv) > 2 else 8000
+rng = np.random.RandomState(0)
+
+# synthetic merged data: most descriptions repeat (payees), some carry a
+# unique reference number, each account has a few source files
+payees = ['Payroll deposit','Grocery store','Coffee shop','Rent payment',
+          'Gas station','Phone bill','Online transfer','Restaurant']
+n = n_accounts*n_rows
+codes = np.repeat(np.arange(n_accounts), n_rows)
+trans = np.array(payees, dtype=object)[rng.randint(0, len(payees), n)]
+unique = rng.rand(n) < 0.2
+trans[unique] = ['Cheque #%d' % i for i in rng.randint(0, 10**6, unique.sum())]
+amount = np.round(rng.normal(0, 200, n), 2)
+data = pd.DataFrame({
+    'Date': pd.to_datetime('2010-01-01') + \
+            pd.to_timedelta(np.sort(rng.randint(0, 3000, n)), 'D'),
+    'Transaction': trans,
+    'Amount': amount,
+    'BalanceEOD': np.round(np.cumsum(amount), 2),
+    'Currency': np.where(codes % 4 == 0, 'USD', 'CAD').astype(object),
+    'Account': ['Account%d' % c for c in codes],
+    'Type': np.array(['Chequing','Savings','Credit'], dtype=object)[codes % 3],
+    'Source': ['file%d.csv' % (c*10 + f) for (c, f) in
+               zip(codes, rng.randint(0, 4, n))]})
+data['USD'] = 1.3
+data['Amount_CAD'] = data['Amount']*data['USD']
+data['BalanceEOD_CAD'] = data['BalanceEOD']*data['USD']
+
+def mb(df): return df.memory_usage(deep=True).sum()/1e6
+
+compact = merged.compact(data.copy())
+print('%d rows, %d accounts' % (n, n_accounts))
+print('merged data in merge.py:   %7.1f MB -> %6.1f MB' % (mb(data), mb(compact)))
+
+# csv output must be identical, then compare loading (as plotbalance.ipynb)
+(fd1, file1) = tempfile.mkstemp(suffix='.csv')
+(fd2, file2) = tempfile.mkstemp(suffix='.csv')
+os.close(fd1)
+os.close(fd2)
+for (df, f) in [(data, file1), (compact, file2)]:
+    df.to_csv(f, index=0, date_format='%Y-%m-%d', float_format='%.2f')
+def read(f):
+    with open(f, 'rb') as fh: return fh.read()
+same = read(file1) == read(file2)
+print('identical csv output:      %s' % same)
+
+plain = pd.read_csv(file1)
+plain['Date'] = pd.to_datetime(plain['Date'].astype(str))
+print('full csv reload:           %7.1f MB -> %6.1f MB'
+      % (mb(plain), mb(merged.load(file1))))
+usecols = ['Date','Account','Type','Currency','BalanceEOD_CAD']
+plain = pd.read_csv(file1, usecols=usecols)
+plain['Date'] = pd.to_datetime(plain['Date'].astype(str))
+print('notebook columns:          %7.1f MB -> %6.1f MB'
+      % (mb(plain), mb(merged.load(file1, usecols=usecols))))
+os.remove(file1)
+os.remove(file2)
@@ -9,13 +9,19 @@ Functions for USD/CAD exchange rates.
 import numpy as np
 import pandas as pd
 import datetime as dt
-import os
 import urllib # for downloading
 import csv # for reading csv files
+import io # for reading downloaded content
+import archive # for archiving raw downloaded data
 
 
 rate_folder = 'fxrate/'
 rate_filename = 'fxrates.csv'
+# source and symbol in raw data archive, must match fxrate_source and
+# fxrate_symbol in tools.py (Python 3 only, not imported here), otherwise
+# tools.rebuildFxRate misses the downloads archived here
+rate_source = 'BankOfCanada'
+rate_symbol = 'USDCAD'
     
 # check if available rates are up to date
 current_data = pd.read_csv(rate_filename)
@@ -29,10 +35,13 @@ if delta.days >= 1:
     url = 'https://www.bankofcanada.ca/valet/observations/FXUSDCAD/csv?'\
             + 'start_date=' + from_date.strftime('%Y-%m-%d')\
             + '&end_date=' + now.strftime('%Y-%m-%d')
-    filename = from_date.strftime('%Y%m%d') + '-' + now.strftime('%Y%m%d') + '.csv'
-    if not os.path.exists(rate_folder): os.makedirs(rate_folder)
-    response = urllib.urlretrieve(url,rate_folder + filename)
-    new_data = pd.read_csv(rate_folder + filename, skiprows=8)
+    content = urllib.urlopen(url).read()
+    new_data = pd.read_csv(io.BytesIO(content), skiprows=8)
+    # raw data are archived as in tools.py, so that rate_filename can be
+    # rebuilt offline: tools.rebuildFxRate(filename='fxrates.csv',ratecol='USD')
+    if len(new_data) > 0:
+        archive.save(content, rate_source, rate_symbol, new_data['date'].min(),
+                     new_data['date'].max(), rate_folder + 'raw')
     temp = pd.DataFrame()
     temp['Date'] = new_data['date']
     temp['USD'] = new_data['FXUSDCAD']
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+# Author: Hoan Bui Dang
+# Python: 2.7
+
+"""
+Optional SQLite storage for merged transaction data (output of merge.py).
+
+    connect(filename):
+        Open (or create) a ledger database and return the connection.
+
+    upsert(conn, data, replace=True):
+        Bulk insert/update merged rows in a single transaction.
+        With replace=True, rows of the accounts present in data that are not
+        in data anymore are deleted, other accounts are left untouched.
+
+    query(conn, start='', end='', accounts=[], columns=[]):
+        Load rows in a date range (and optionally for some accounts only)
+        into a dataframe.
+"""
+
+import pandas as pd
+import sqlite3
+import hashlib
+import merged # for compact column types
+
+table = 'ledger'
+key_cols = ['Account','Date','Source','Hash']
+value_cols = ['Transaction','Amount','Balance','BalanceEOD','Currency',\
+                'Type','USD','Amount_CAD','BalanceEOD_CAD']
+text_cols = ['Account','Date','Source','Hash','ValueHash',\
+                'Transaction','Currency','Type']
+all_cols = key_cols + ['ValueHash'] + value_cols
+out_cols = ['Date','Transaction','Amount','BalanceEOD','Currency','Account',\
+            'Type','Source','USD','Amount_CAD','BalanceEOD_CAD'] # as in merge.py
+
+def totext(s):
+    """ decode utf-8 byte strings (non-ASCII text read by pandas in 2.7) """
+    return s.decode('utf-8') if isinstance(s, bytes) else s
+def tobytes(s): return totext(s).encode('utf-8')
+def sha1(s): return hashlib.sha1(tobytes(s)).hexdigest()
+
+def connect(filename):
+    """
+    Open ledger database, create table and indexes if needed. The temporary
+    table new_keys (used by upsert) is also created here: Python 2.7 sqlite3
+    commits any pending transaction before a CREATE statement, so it must
+    not be created inside the write transaction.
+    """
+
+    conn = sqlite3.connect(filename)
+    cols = ', '.join('"%s" %s' % (c, 'TEXT' if c in text_cols else 'REAL')
+                     for c in all_cols)
+    conn.execute('CREATE TABLE IF NOT EXISTS %s (%s, PRIMARY KEY (%s))'
+                 % (table, cols, ', '.join(key_cols)))
+    conn.execute('CREATE INDEX IF NOT EXISTS ix_account_date '
+                 'ON %s (Account, Date)' % table)
+    conn.execute('CREATE INDEX IF NOT EXISTS ix_date ON %s (Date)' % table)
+    # keyed like the ledger, so that looking up a stored row is an index search
+    conn.execute('CREATE TEMP TABLE IF NOT EXISTS new_keys (%s, PRIMARY KEY (%s))'
+                 % (', '.join(key_cols), ', '.join(key_cols)))
+    conn.commit()
+    return conn
+
+def addhash(data):
+    """
+    Return a copy of data with columns 'ValueHash' and 'Hash'.
+
+    ValueHash identifies a transaction regardless of its source file, it is
+    made of the same values merge.py uses to find duplicates: Account, Date,
+    Transaction, Amount, Currency, Type and the imported Balance (taken as 0
+    if data has no Balance column, as merge.py does for accounts without
+    balance data). Amounts and balances are compared as exact floats, like
+    in merge.py. Rows with missing Balance are never duplicates in merge.py
+    (groupby drops them), so their ValueHash also includes Source.
+
+    Identical transactions within the same source are allowed, so Hash also
+    includes the occurence number of the transaction in its source, making
+    (Account, Date, Source, Hash) unique.
+
+    Text columns are decoded to unicode, as sqlite3 does not accept 8-bit
+    byte strings.
+    """
+
+    data = data.copy()
+    for c in ['Account','Source','Transaction','Currency','Type']:
+        if c in data.columns: data[c] = data[c].map(totext)
+    if 'Balance' not in data.columns: data['Balance'] = 0.0
+    dates = data['Date'].dt.strftime('%Y-%m-%d')
+    data['ValueHash'] = [sha1('|'.join([a, d, t, repr(float(amt)), cur, typ,
+            repr(float(bal)) if bal == bal else 'nan|' + s]))
+        for (a, d, t, amt, cur, typ, bal, s) in zip(data['Account'], dates,
+        data['Transaction'], data['Amount'], data['Currency'], data['Type'],
+        data['Balance'], data['Source'])]
+    # ValueHash includes Account, group by plain strings (not categorical)
+    n = data.groupby(data['ValueHash'] + '|' + data['Source'].astype(str),
+                     sort=False).cumcount()
+    data['Hash'] = [sha1(h + '#' + str(i)) for (h, i) in zip(data['ValueHash'], n)]
+    return data
+
+def dedup(conn, accounts):
+    """
+    Remove transactions found in multiple sources, keep the source with max
+    occurences, same rules as in merge.py. If tied, merge.py keeps the first
+    source file read, here the source stored first is kept.
+    """
+
+    removed = 0
+    for a in accounts:
+        counts = pd.read_sql_query('SELECT ValueHash, Source, COUNT(*) AS Count,'
+            ' MIN(rowid) AS First FROM %s WHERE Account = ?'
+            ' GROUP BY ValueHash, Source' % table, conn, params=[a])
+        multi = counts.duplicated('ValueHash', keep=False)
+        if not any(multi): continue
+        counts = counts[multi].sort_values(['ValueHash','Count','First'],
+                                           ascending=[True,False,True])
+        dups = counts[counts.duplicated('ValueHash')]
+        cur = conn.executemany('DELETE FROM %s WHERE Account = ? AND '
+            'ValueHash = ? AND Source = ?' % table,
+            [(a, h, s) for (h, s) in zip(dups['ValueHash'], dups['Source'])])
+        removed += cur.rowcount
+    return removed
+
+def upsert(conn, data, replace=True):
+    """
+    Write merged data to the ledger in a single transaction, return the
+    number of rows in data.
+
+    Existing rows (same key) are updated in place, new rows are inserted.
+    If replace is True, the data of each account in data is taken to be
+    complete: stored rows of these accounts that are not in data are
+    deleted. Rows of other accounts are never touched.
+    """
+
+    data = addhash(data)
+    data['Date'] = data['Date'].dt.strftime('%Y-%m-%d')
+    cols = [c for c in value_cols if c in data.columns]
+    # convert to python types (sqlite3 does not accept numpy scalars)
+    records = data[cols + ['ValueHash'] + key_cols].astype(object)
+    records = records.where(records.notnull(), None).values.tolist()
+    accounts = data['Account'].unique().tolist()
+
+    with conn: # commit at the end, or roll back everything on error
+        conn.executemany('UPDATE %s SET %s, ValueHash = ? WHERE %s' % (table,
+            ', '.join('"%s" = ?' % c for c in cols),
+            ' AND '.join('%s = ?' % c for c in key_cols)), records)
+        conn.executemany('INSERT OR IGNORE INTO %s (%s) VALUES (%s)' % (table,
+            ', '.join('"%s"' % c for c in cols + ['ValueHash'] + key_cols),
+            ', '.join(['?']*(len(cols) + 1 + len(key_cols)))), records)
+        if replace:
+            conn.execute('DELETE FROM new_keys')
+            conn.executemany('INSERT INTO new_keys VALUES (?,?,?,?)',
+                             data[key_cols].values.tolist())
+            conn.executemany('DELETE FROM %s WHERE Account = ? AND NOT EXISTS'
+                ' (SELECT 1 FROM new_keys k WHERE %s)' % (table,
+                ' AND '.join('k.%s = %s.%s' % (c, table, c) for c in key_cols)),
+                [(a,) for a in accounts])
+            conn.execute('DELETE FROM new_keys')
+        dedup(conn, accounts)
+    return len(records)
+
+def query(conn, start='', end='', accounts=[], columns=[]):
+    """
+    Load rows with start <= Date <= end (full range if not specified) for
+    a list of accounts (all accounts if empty), sorted by account and date.
+    """
+
+    columns = columns if len(columns) > 0 else out_cols
+    where, params = [], []
+    if start != '':
+        where.append('Date >= ?')
+        params.append(pd.to_datetime(start).strftime('%Y-%m-%d'))
+    if end != '':
+        where.append('Date <= ?')
+        params.append(pd.to_datetime(end).strftime('%Y-%m-%d'))
+    accounts = [accounts] if isinstance(accounts, str) else list(accounts)
+    if len(accounts) > 0:
+        where.append('Account IN (%s)' % ','.join(['?']*len(accounts)))
+        params += accounts
+    sql = 'SELECT %s FROM %s' % (', '.join('"%s"' % c for c in columns), table)
+    if len(where) > 0: sql += ' WHERE ' + ' AND '.join(where)
+    sql += ' ORDER BY Account, Date, rowid'
+    data = pd.read_sql_query(sql, conn, params=params)
+    if 'Date' in data.columns: data['Date'] = pd.to_datetime(data['Date'])
+    return merged.compact(data)
@@ -11,8 +11,10 @@ import numpy as np
 import pandas as pd
 import re # for regex
 import glob # for file matching
+import merged # compact column types of merged data
 
 folder = 'data'
+ledger_file = '' # optional SQLite ledger to update, e.g. folder+'_merged.db'
 info = pd.read_csv(folder + '/accounts.csv', skiprows=15)
 info = info.fillna(0) # fill in 0 for blank values
 int_cols = range(6,16) # columns to be converted to type int
@@ -37,6 +39,7 @@ def flatten(list_of_lists):
     return [e for x in list_of_lists for e in x]
 
 data_list = []
+merged_accounts = [] # account information and EOD rule for data_list
 verified_accounts = []
 nobalance_accounts = []
 ignored_accounts = []
@@ -218,9 +221,6 @@ for a in info.Account: # loop through all account names
     basic = pd.DataFrame()
     copy_cols = ['Date','Transaction','Amount','Source']
     basic[copy_cols] = raw[copy_cols]
-    basic['Currency'] = currency
-    basic['Account'] = a
-    basic['Type'] = account_type
     basic['Balance'] = raw[balance_col] if balance_col >= 0 else 0
     
     #==========================================================================
@@ -319,66 +319,113 @@ for a in info.Account: # loop through all account names
                 i += 1
 
     #==========================================================================
-    # calculate end-of-day balance (EOD)
+    # choose how to calculate end-of-day balance (EOD)
     #==========================================================================
     #
-    # If balance data is available:
-    #    If data is consistent: group amounts by date, cumsum to calculate EOD.
-    #    If data is inconsistent: take EOD to be the last balance of each date.
-    #    Ignore anchor balance.
-    # If balance data is not available:
-    #    Calculate EOD assuming zero initial balance.
-    #    If anchor balance is provided, use it to offset EOD so that EOD of
-    #    the nearest date on or before the anchor date is equal to the
-    #    anchor balance. If anchor date is earlier than all data dates, then
-    #    use anchor balance as the initial balance.
+    # EOD itself is calculated for all accounts at once after this loop.
+    # Here only the rule for each account is recorded in merged_accounts:
+    # Last:
+    #    True if balance data is available but inconsistent, EOD is then
+    #    the last balance of each date (times Sign).
+    # Offset:
+    #    Otherwise EOD is the cumulative sum of amounts plus Offset, which
+    #    is the initial balance found by verification, or anchor balance.
+    # Anchor:
+    #    If not NaT, Offset (anchor balance) is the EOD on the nearest date
+    #    on or before Anchor, instead of the initial balance.
+    # Extend:
+    #    Add a row to extend balance date for active accounts.
 
-    nodup.sort_values(by='Date', kind='mergesort', inplace=True)
-    nodup.reset_index(drop=True, inplace=True)
-    g = nodup.groupby('Date', sort=False)
-    if (balance_col >= 0) & (a not in verified_accounts):
-        nodup = nodup.join(balance_sign*g.Balance.last(),on='Date',rsuffix='EOD')
-    else:
-        eod = g.Amount.sum().cumsum()
-        if (balance_col >= 0) & (a in verified_accounts):
-            eod += balance_diff
-            if anchor_date != 0: 
-                error('Anchor balance ignored in presence of balance data.',a,'Warning')
-        elif anchor_date != 0:
-            if anchor_date < min(eod.index):
-                eod += anchor_bal
+    last = (balance_col >= 0) & (a not in verified_accounts)
+    sign = balance_sign if last else 1
+    offset, anchor = 0, pd.NaT
+    if (balance_col >= 0) & (a in verified_accounts):
+        offset = balance_diff
+        if anchor_date != 0: 
+            error('Anchor balance ignored in presence of balance data.',a,'Warning')
+    elif (balance_col < 0) & (anchor_date != 0):
+        offset = anchor_bal
+        (first_date, last_date) = (nodup.Date.min(), nodup.Date.max())
+        if anchor_date < first_date:
+            error('Anchor balance date out of data range.',a,'Warning')
+            print 'If possible, use an anchor date between: ',\
+                  first_date.date(),' & ',last_date.date(),'.'
+            print 'Anchor balance was considered as initial balance.'
+        else:
+            anchor = anchor_date
+            if anchor_date > last_date:
                 error('Anchor balance date out of data range.',a,'Warning')
                 print 'If possible, use an anchor date between: ',\
-                      min(eod.index).date(),' & ',max(eod.index).date(),'.'
-                print 'Anchor balance was considered as initial balance.'
-            else:
-                idx = eod[eod.index<=anchor_date].reset_index().Date.idxmax()
-                eod += anchor_bal - eod.iloc[idx]
-                if anchor_date > max(eod.index):
-                    error('Anchor balance date out of data range.',a,'Warning')
-                    print 'If possible, use an anchor date between: ',\
-                      min(eod.index).date(),' & ',max(eod.index).date(),'.'
-                    print 'Anchor balance was considered as balance of the last date.'
-        else:
-            #error('No balance data or anchor balance provided.',a,'Warning')
-            nobalance_accounts.append(a)
-        nodup = nodup.join(eod.to_frame('BalanceEOD'),on='Date')
-        
-        # add row to extend balance date for active accounts
-        if info.Active[a] == 1:
-            newline = nodup.loc[len(nodup)-1]
-            newline.Transaction = 'Automatic balance update'
-            newline.Source = 'merge.py'
-            newline.Amount = 0
-            nodup.loc[len(nodup)] = newline
-            #nodup = nodup.append(newline)
+                  first_date.date(),' & ',last_date.date(),'.'
+                print 'Anchor balance was considered as balance of the last date.'
+    elif balance_col < 0:
+        #error('No balance data or anchor balance provided.',a,'Warning')
+        nobalance_accounts.append(a)
+    extend = (not last) & (info.Active[a] == 1)
 
     data_list.append(nodup)
+    merged_accounts.append((a, currency, account_type,\
+                            last, sign, offset, anchor, extend))
     # ================= end of for loop through all accounts ==================
     
 # concatenate data from all accounts and export to csv
 if len(data_list) > 0: 
-    data = pd.concat(data_list, ignore_index=True)[all_cols]
+    data = pd.concat(data_list, ignore_index=True)
+    acc = pd.DataFrame(merged_accounts, columns=['Account','Currency','Type',\
+                        'Last','Sign','Offset','Anchor','Extend'])
+    codes = np.repeat(np.arange(len(acc)), [len(x) for x in data_list])
+
+    # ===================== end-of-day balance (EOD) ==========================
+    # Notes:
+    # 1. codes are account numbers (rows of acc) of each row in data. Sorting
+    #    by codes and dates (np.lexsort is stable) puts all days of each
+    #    account together, so that one groupby over (account, date) gives
+    #    the daily sums, and a cumsum grouped by account gives the EOD.
+    # 2. To find the EOD on the nearest date on or before the anchor date,
+    #    (account, date) pairs are combined into one sorted integer key
+    #    (account * number of days + day) for np.searchsorted.
+    # 3. Extension rows are copies of the last row of each account, added in
+    #    one go then moved to the end of their accounts by a stable sort.
+    order = np.lexsort((data['Date'].values, codes))
+    data = data.iloc[order].reset_index(drop=True)
+    g = data.groupby([codes, 'Date'], sort=False)
+    daily = g.Amount.sum()
+    day_code = daily.index.get_level_values(0).values
+    day_date = daily.index.get_level_values(1)
+    eod = daily.groupby(level=0).cumsum().values
+    offset = acc['Offset'].values.astype(float)
+    anchored = np.flatnonzero(acc['Anchor'].notnull().values)
+    if len(anchored) > 0:
+        day_min = day_date.min()
+        ndays = (day_date.max() - day_min).days + 1
+        key = day_code*ndays + (day_date - day_min).days.values
+        anchor_days = (pd.DatetimeIndex(acc['Anchor'][anchored]) - day_min).days.values
+        anchor_key = anchored*ndays + np.minimum(anchor_days, ndays-1)
+        offset[anchored] -= eod[np.searchsorted(key, anchor_key, 'right') - 1]
+    eod = eod + offset[day_code]
+    last = acc['Last'].values.astype(bool)[day_code]
+    if any(last):
+        balance = acc['Sign'].values[day_code] * g.Balance.last().values
+        eod = np.where(last, balance, eod)
+    data['BalanceEOD'] = eod[g.ngroup().values]
+
+    is_last_row = np.r_[codes[1:] != codes[:-1], True]
+    ext = data[is_last_row & acc['Extend'].values.astype(bool)[codes]].copy()
+    ext['Transaction'] = 'Automatic balance update'
+    ext['Source'] = 'merge.py'
+    ext['Amount'] = 0
+    codes = np.r_[codes, codes[ext.index]]
+    order = np.argsort(codes, kind='mergesort')
+    data = pd.concat([data, ext], ignore_index=True).iloc[order]
+    data.reset_index(drop=True, inplace=True)
+    codes = codes[order]
+
+    # add account information as categorical columns: each value is stored
+    # once per account instead of being repeated on every row
+    for col in ['Account','Currency','Type']:
+        data[col] = pd.Categorical(acc[col])[codes]
+    balance = data['Balance'] # imported balances, to find duplicates in ledger
+    data = merged.compact(data)[all_cols]
 
     date_max = data.Date.max() + pd.DateOffset(1)
     data.loc[data.Source=='merge.py','Date'] = date_max
@@ -408,6 +455,14 @@ if len(data_list) > 0:
     
     data.to_csv(folder+'_merged.csv',index=0,date_format='%Y-%m-%d',float_format='%.2f')
     print '\nData have been successfully merged and saved as "'+folder+'_merged.csv".'
+    if ledger_file != '': # only rows of the merged accounts are updated
+        import ledger
+        conn = ledger.connect(ledger_file)
+        try:
+            ledger.upsert(conn, data.assign(Balance=balance))
+        finally:
+            conn.close()
+        print 'Data of merged accounts have been updated in "'+ledger_file+'".'
     
     if len(ignored_accounts) > 0:
         print '\nAccounts that were ignored due to errors:'
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+# Author: Hoan Bui Dang
+# Python: 2.7
+
+"""
+Compact in-memory representation of merged data (output of merge.py).
+
+    compact(data):
+        Convert text columns of merged data to categorical type.
+
+    load(filename, usecols=None):
+        Load merged data from csv file, with compact column types.
+"""
+
+import pandas as pd
+
+category_cols = ['Transaction','Currency','Account','Type','Source']
+
+def compact(data):
+    """
+    Convert text columns to categorical type (in place) and return data.
+    Account, Currency, Type and Source only have a few distinct values and
+    most transaction descriptions repeat, so each value is stored once and
+    rows only keep small integer codes. Values written to csv are the same.
+    """
+
+    for c in category_cols:
+        if c in data.columns: data[c] = data[c].astype('category')
+    return data
+
+def load(filename, usecols=None):
+    """ Load merged data from csv file, with compact column types. """
+
+    dates = ['Date'] if (usecols is None) or ('Date' in usecols) else False
+    return pd.read_csv(filename, usecols=usecols, parse_dates=dates,
+                       dtype=dict((c, 'category') for c in category_cols))
@@ -12,11 +12,21 @@ A package of tools for investment:
         Load price from csv for a single or list of symbols.
         Return a series or a dictionary of series.
     
+    rebuildPrice(symbol, folder=price_folder, source=''):
+        Rebuild price csv files from archived raw data, without downloading.
+    
     downloadFxRate(folder, start, end):
         Downloading and saving exchange rates to csv file.
     
     loadFxRate(folder=fxrate_folder, start='2012-01-03', end=today):
         Load rates from csv file and return a series indexed by dates.
+    
+    rebuildFxRate(folder=fxrate_folder, filename='', ratecol='Rate'):
+        Rebuild exchange rate csv file from archived raw data. Use
+        filename='fxrates.csv', ratecol='USD' for the rate file of merge.py.
+
+Raw downloaded data are kept in a compressed archive in <folder>/raw
+(see archive.py), identical or overlapping downloads are stored only once.
 """
 
 import pandas as pd
@@ -24,6 +34,7 @@ import datetime as dt
 import os # for creating folders
 import io # for reading page content to dataframe
 import requests # for downloading from the web
+import archive # for archiving raw downloaded data
 
 # =============================================================================
 # Parameters and global variables
@@ -49,6 +60,11 @@ fxrate_url = 'https://www.bankofcanada.ca/valet/observations/FXUSDCAD/csv?start_
 fxrate_datecol = 'date'
 fxrate_ratecol = 'FXUSDCAD'
 fxrate_skip = 8
+# source and symbol in raw data archive, must match rate_source and
+# rate_symbol in getrate.py (used by merge.py), otherwise rebuildFxRate
+# misses the downloads archived there
+fxrate_source = 'BankOfCanada'
+fxrate_symbol = 'USDCAD'
 
 choice_all = 0
 # =============================================================================
@@ -64,6 +80,23 @@ def symbolVariants(symbol):
     else:
         return [symbol]
 
+def readPrice(content, source):
+    """ Read prices (Date, Price) from raw content downloaded from source. """
+
+    raw = pd.read_csv(io.StringIO(content.decode('utf-8')), na_values='null')
+    data = pd.DataFrame({'Date': raw[APIs['datecol'][source]],
+                         'Price': raw[APIs['pricecol'][source]]})
+    data = data[data['Price']!=0]
+    return data.dropna()
+
+def readFxRate(content):
+    """ Read rates (Date, Rate) from raw content downloaded from BoC. """
+
+    raw = pd.read_csv(io.StringIO(content.decode('utf-8')), 
+                      skiprows = fxrate_skip, na_values = ' Bank holiday')
+    data = pd.DataFrame({'Date':raw[fxrate_datecol], 'Rate':raw[fxrate_ratecol]})
+    return data[data['Rate']!=0].dropna()
+
 def date2unix(date): return str(round(dt.datetime.strptime(date, "%Y-%m-%d").timestamp()))
 def unix2date(timestamp): return dt.datetime.fromtimestamp(int(timestamp))
 
@@ -99,12 +132,8 @@ def downloadPriceSingle(symbol,folder,start,end,source,varysymbol):
         print('Completed.')
         
         # if no error occurs, process and save page content
-        raw = pd.read_csv(io.StringIO(page.content.decode('utf-8')),
-                          na_values='null')
-        data = pd.DataFrame({'Date': raw[APIs['datecol'][source]],
-                             'Price': raw[APIs['pricecol'][source]]})
-        data = data[data['Price']!=0]
-        data = data.dropna()
+        data = readPrice(page.content, source)
+        (date_min, date_max) = (data['Date'].min(), data['Date'].max())
         
         global choice_all
         if os.path.exists(folder+'/'+symbol+'.csv'):
@@ -140,12 +169,8 @@ def downloadPriceSingle(symbol,folder,start,end,source,varysymbol):
         data.to_csv(folder+'/'+symbol+'.csv',index=False,float_format='%.2f')
 
         # save raw data as backup
-        folder_raw = folder + '/raw/' + source
-        date_min = raw[APIs['datecol'][source]].min()
-        date_max = raw[APIs['datecol'][source]].max()
-        filename = '_'.join([symbol,'from',date_min,'to',date_max])
-        if not os.path.exists(folder_raw): os.makedirs(folder_raw)
-        open(folder_raw + '/' + filename + '.csv','wb').write(page.content)
+        archive.save(page.content,source,symbol,date_min,date_max,folder+'/raw',
+                     parse=lambda content: readPrice(content,source))
         
         return 1
     
@@ -223,6 +248,39 @@ def loadPrice(symbol, folder=price_folder, start='', end=''):
             data[each_symbol] = prices
     return data
 
+def rebuildPrice(symbol, folder=price_folder, source=''):
+    """ 
+    Rebuild price csv files of a single or a list of stocks from archived
+    raw data (from a given source or all sources), without downloading.
+    For dates found in several downloads, the latest download is used.
+    Prices before the first archived date cannot be rebuilt, they are kept
+    from the existing file if any.
+    Return a list of symbols that have no archived data.
+    """
+    
+    symbol = [symbol] if type(symbol) == str else symbol
+    missing = []
+    for each_symbol in symbol:
+        index = archive.entries(folder+'/raw', source, each_symbol)
+        if len(index) == 0:
+            missing.append(each_symbol)
+            continue
+        data = pd.concat([readPrice(archive.load(h,folder+'/raw'),s) 
+                          for (h,s) in zip(index['Hash'],index['Source'])])
+        data = data.drop_duplicates(subset='Date', keep='last')
+        filename = folder+'/'+each_symbol+'.csv'
+        if os.path.exists(filename):
+            old = pd.read_csv(filename)
+            old = old[old['Date'] < data['Date'].min()]
+            if len(old) > 0:
+                print('Prices before %s kept from %s.' % (data['Date'].min(),filename))
+            data = pd.concat([old[['Date','Price']], data])
+        data.sort_values(by='Date', kind='quicksort', inplace=True)
+        data.to_csv(filename,index=False,float_format='%.2f')
+    if len(missing) > 0:
+        print('No archived data for:', ', '.join(missing))
+    return missing
+
 # =============================================================================
 # Functions for downloading and loading exchange rates
 # =============================================================================
@@ -241,10 +299,8 @@ def downloadFxRate(folder,start,end):
         print('Failed to download exchange rates.')
         return 0
     print('Completed.')
-    raw = pd.read_csv(io.StringIO(page.content.decode('utf-8')), 
-                      skiprows = fxrate_skip, na_values = ' Bank holiday')
-    data = pd.DataFrame({'Date':raw['date'], 'Rate':raw['FXUSDCAD']})
-    data = data[data['Rate']!=0].dropna()
+    data = readFxRate(page.content)
+    (date_min, date_max) = (data['Date'].min(), data['Date'].max())
     #print(data)
     
     if os.path.exists(folder + '/' + fxrate_file):
@@ -260,12 +316,8 @@ def downloadFxRate(folder,start,end):
     data.to_csv(folder+'/'+fxrate_file,index=False,float_format='%.4f')
     print('Completed.')
     # save raw data as backup
-    folder_raw = folder + '/raw'
-    date_min = raw[fxrate_datecol].min()
-    date_max = raw[fxrate_datecol].max()
-    filename = '_'.join(['from',date_min,'to',date_max])
-    if not os.path.exists(folder_raw): os.makedirs(folder_raw)
-    open(folder_raw + '/' + filename + '.csv','wb').write(page.content)
+    archive.save(page.content, fxrate_source, fxrate_symbol,
+                 date_min, date_max, folder + '/raw', parse=readFxRate)
 
 def loadFxRate(folder=fxrate_folder, start='2012-01-03', end=today):
     """  Load FX rate from file and return a series indexed by dates. """
@@ -289,4 +341,33 @@ def loadFxRate(folder=fxrate_folder, start='2012-01-03', end=today):
     data = pd.merge_asof(date_range,data,on='Date').dropna()
 
     return pd.Series(data['Rate'].tolist(),index=data['Date'].tolist())
-    
\ No newline at end of file
+
+def rebuildFxRate(folder=fxrate_folder, filename='', ratecol='Rate'):
+    """ 
+    Rebuild exchange rate csv file from archived raw data in folder/raw,
+    without downloading. The file is folder/USD.csv by default, with
+    columns Date and Rate (as written by downloadFxRate). getrate.py (used
+    by merge.py) archives to the same folder, its rate file is rebuilt with
+    filename='fxrates.csv' and ratecol='USD'.
+    Rates before the first archived date cannot be rebuilt, they are kept
+    from the existing file if any.
+    """
+
+    filename = folder+'/'+fxrate_file if filename == '' else filename
+    index = archive.entries(folder+'/raw', fxrate_source, fxrate_symbol)
+    if len(index) == 0:
+        print('No archived exchange rate data in %s.' % (folder+'/raw'))
+        return 0
+    data = pd.concat([readFxRate(archive.load(h, folder+'/raw')) 
+                      for h in index['Hash']])
+    data = data.drop_duplicates(subset='Date', keep='last')
+    if os.path.exists(filename):
+        old = pd.read_csv(filename).rename(columns={ratecol:'Rate'})
+        old = old[old['Date'] < data['Date'].min()]
+        if len(old) > 0:
+            print('Rates before %s kept from %s.' % (data['Date'].min(),filename))
+        data = pd.concat([old[['Date','Rate']], data])
+    data.sort_values(by='Date', kind='quicksort', inplace=True)
+    data = data.rename(columns={'Rate':ratecol})
+    data.to_csv(filename,index=False,float_format='%.4f')
+    return 1